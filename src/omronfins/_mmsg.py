@@ -0,0 +1,140 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright (c) 2022 Taishi Ueda <taishi.ueda@gmail.com>
+#
+"""!_mmsg
+@brief sendmmsg(2) and recvmmsg(2) called by ctypes.
+It is imported by finsudp on first use.
+"""
+import socket
+import errno
+import os
+import sys
+import ctypes
+from .finsudp import _wait_socket as wait_socket
+
+
+class IOVec(ctypes.Structure):
+    """!
+    struct iovec
+    """
+    _fields_ = [
+            ('iov_base', ctypes.c_void_p),
+            ('iov_len', ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    """!
+    struct msghdr
+    """
+    _fields_ = [
+            ('msg_name', ctypes.c_void_p),
+            ('msg_namelen', ctypes.c_uint32),
+            ('msg_iov', ctypes.POINTER(IOVec)),
+            ('msg_iovlen', ctypes.c_size_t),
+            ('msg_control', ctypes.c_void_p),
+            ('msg_controllen', ctypes.c_size_t),
+            ('msg_flags', ctypes.c_int)]
+
+
+class MMsgHdr(ctypes.Structure):
+    """!
+    struct mmsghdr
+    """
+    _fields_ = [
+            ('msg_hdr', MsgHdr),
+            ('msg_len', ctypes.c_uint)]
+
+
+libc = None
+if sys.platform.startswith('linux'):
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.sendmmsg.argtypes = [
+                ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [
+                ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                ctypes.c_void_p]
+    except (OSError, AttributeError):
+        libc = None
+
+
+def sendmmsg(sock, msgs, deadline):
+    """!
+    Send messages by one sendmmsg(2) call as far as possible.
+    @param[in] sock connected socket.
+    @param[in] msgs list of bytes.
+    @param[in] deadline time.monotonic() to give up. None means forever.
+    """
+    num = len(msgs)
+    c_msgs = [ctypes.c_char_p(a_msg) for a_msg in msgs]
+    iovs = (IOVec*num)()
+    hdrs = (MMsgHdr*num)()
+    for i, a_msg in enumerate(msgs):
+        iovs[i].iov_base = ctypes.cast(c_msgs[i], ctypes.c_void_p)
+        iovs[i].iov_len = len(a_msg)
+        hdrs[i].msg_hdr.msg_iov = ctypes.pointer(iovs[i])
+        hdrs[i].msg_hdr.msg_iovlen = 1
+    sent = 0
+    while sent < num:
+        ret = libc.sendmmsg(
+                sock.fileno(),
+                ctypes.addressof(hdrs) + sent*ctypes.sizeof(MMsgHdr),
+                num - sent, 0)
+        if ret >= 0:
+            sent += ret
+            continue
+        err = ctypes.get_errno()
+        if err == errno.EINTR:
+            continue
+        if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+            if not wait_socket(sock, deadline, True):
+                raise socket.timeout()
+            continue
+        raise OSError(err, os.strerror(err))
+
+
+class RecvVector():
+    """!
+    Preallocated buffers to receive messages by recvmmsg(2).
+    @param[in] vlen maximum number of messages received at once.
+    @param[in] size maximum size of a message.
+    """
+    def __init__(self, vlen, size):
+        self._vlen = vlen
+        self._size = size
+        self._buf = bytearray(vlen*size)
+        self._mv = memoryview(self._buf)
+        self._c_buf = (ctypes.c_char*len(self._buf)).from_buffer(self._buf)
+        self._iovs = (IOVec*vlen)()
+        self._hdrs = (MMsgHdr*vlen)()
+        base = ctypes.addressof(self._c_buf)
+        for i in range(vlen):
+            self._iovs[i].iov_base = base + i*size
+            self._iovs[i].iov_len = size
+            self._hdrs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovs[i])
+            self._hdrs[i].msg_hdr.msg_iovlen = 1
+
+    def recv(self, sock, num):
+        """!
+        Receive messages which have already arrived without blocking.
+        @param[in] sock socket.
+        @param[in] num maximum number of messages.
+        @return list of bytes. It is empty if no message has arrived.
+        """
+        while True:
+            ret = libc.recvmmsg(
+                    sock.fileno(), ctypes.addressof(self._hdrs),
+                    min(num, self._vlen), socket.MSG_DONTWAIT, None)
+            if ret >= 0:
+                break
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(err, os.strerror(err))
+        return [bytes(self._mv[i*self._size:i*self._size + self._hdrs[i].msg_len])
+                for i in range(ret)]
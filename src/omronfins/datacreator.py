@@ -8,7 +8,8 @@
 @brief Data creator for Omron FINS protocol.
 """
 import struct
-import binascii
+import functools
+import array
 
 
 class DataCreator():
@@ -136,8 +137,10 @@ class DataCreator():
         self._src_node_num = src_node_num
         self._src_unit_addr = src_unit_addr
         self._srv_id = srv_id
+        self._src_suffix = bytes(
+                (src_net_addr, src_node_num, src_unit_addr, srv_id))
         self._header_bin = None
-        self.set_destination(0, 0)
+        self._resp_addr = None
 
     def set_destination(self, dst_net_addr, dst_node_num, dst_unit_addr=0, delay=2):
         """!
@@ -166,6 +169,36 @@ class DataCreator():
         @return bytes encoded header
         """
         self._header_bin = self._create_header(dst_node_num, dst_unit_addr, dst_net_addr, delay)
+        # A response is sent back with source and destination swapped.
+        self._resp_addr = (
+                self._src_suffix[:3]
+                + bytes((dst_net_addr, dst_node_num, dst_unit_addr))
+                + self._src_suffix[3:])
+
+    def is_response_to_me(self, response, srv_id=None):
+        """!
+        Check whether a received message is a response to commands
+        sent from this source to the destination.
+        @param[in] response bytes data received.
+        @param[in] srv_id service ID of the command. If None, the service
+            ID given to the initializer is expected.
+        @return True if the addresses and the service ID in the response
+            match this source and the destination.
+        """
+        self._header()
+        if srv_id is None:
+            return response[3:10] == self._resp_addr
+        return response[3:9] == self._resp_addr[:6] and response[9] == srv_id
+
+    def _header(self):
+        """!
+        Get the header of commands. If set_destination has not been
+        called, the destination is set to node 0 of the local network.
+        @return bytes encoded header
+        """
+        if self._header_bin is None:
+            self.set_destination(0, 0)
+        return self._header_bin
 
     def _convert_data2ascii(self, data):
         """!
@@ -179,52 +212,29 @@ class DataCreator():
                  (b'Hoge', DataCreator.STR)]
         @return bytes
         """
-        out_bin = b''
+        parts = []
         for a_data in data:
-            if a_data[1] == DataCreator.BYTES:
-                data_bin = a_data[0]
-            elif a_data[1] == DataCreator.STR:
-                data_bin = a_data[0][::-1].encode('utf-8')
-            else:
-                data_bin = struct.pack('!'+a_data[1][0], a_data[0])
-            data_size = len(data_bin)
-            # If the data is loger than 16bit 1element,
-            # it must be swapped to be read correctory by PLC
-            if data_size > 2 and a_data[1] != DataCreator.BYTES:
-                # set length dividable by two
-                if data_size%2 != 0:
-                    data_inv = b'\x00' + data_bin
-                    data_size += 1
-                else:
-                    data_inv = data_bin
-                ushorts = struct.unpack(
-                        '!'+str(data_size//2)+'H', data_inv)
-                ushorts_swapped = ushorts[::-1]
-                data_bin = struct.pack(
-                        '!'+str(data_size//2)+'H', *ushorts_swapped)
-            out_bin += data_bin
-        return out_bin
+            parts.append(_ENCODERS[a_data[1][0]](a_data[0]))
+        return b''.join(parts)
 
     def decode_read_data(self, data, dtype):
         """! Decode received data.
-        @param[in] data bytes data received.
+        @param[in] data bytes data received. Any bytes-like object such
+           as memoryview is accepted.
         @param[in] dtype type of data. If received data is longer than
            the input data type, then tuple of values as the data type
            will be returned.
         """
-        ret_id = struct.unpack('!H', data[12:14])[0]
+        ret_id = _RET_ID.unpack_from(data, 12)[0]
         if len(data) < 14:
             return ret_id, None
-        values = data[14:]
         if dtype == DataCreator.STR or dtype[1] > 2:
-            num_elem = len(values)//2
-            ushorts = struct.unpack("!"+str(num_elem)+'H', values)
-            ushorts_swapped = ushorts[::-1]
-            data_bin = struct.pack('!'+str(num_elem)+'H', *ushorts_swapped)
+            data_bin = _swap_words(memoryview(data)[14:])
+            num_elem = len(data_bin)//dtype[1]
+            unpacked = _get_struct(num_elem, dtype[0]).unpack(data_bin)
         else:
-            data_bin = values
-        num_elem = len(data_bin)//dtype[1]
-        unpacked = struct.unpack("!"+str(num_elem)+dtype[0], data_bin)
+            num_elem = (len(data) - 14)//dtype[1]
+            unpacked = _get_struct(num_elem, dtype[0]).unpack_from(data, 14)
         if dtype == DataCreator.STR:
             decoded = unpacked[0][::-1].decode('utf-8')
             return ret_id, decoded.partition('\x00')[0]
@@ -232,17 +242,29 @@ class DataCreator():
             unpacked = unpacked[0]
         return ret_id, unpacked
 
+    def decode_read_data_raw(self, data):
+        """! Split received data into the end code and the raw payload.
+        @param[in] data bytes data received. Any bytes-like object such
+           as memoryview is accepted.
+        @return (return_id, payload) payload is a memoryview of data
+           after the end code, in the order it came on the wire.
+        """
+        ret_id = _RET_ID.unpack_from(data, 12)[0]
+        return ret_id, memoryview(data)[14:]
+
     def _create_header(self, dst_node_num, dst_unit_addr, dst_net_addr=0, delay=2):
-        fmt = [
-                (b'\x80\x00\x02', DataCreator.BYTES),
-                (dst_net_addr, DataCreator.UCHAR),
-                (dst_node_num, DataCreator.UCHAR),
-                (dst_unit_addr, DataCreator.UCHAR),
-                (self._src_net_addr, DataCreator.UCHAR),
-                (self._src_node_num, DataCreator.UCHAR),
-                (self._src_unit_addr, DataCreator.UCHAR),
-                (self._srv_id, DataCreator.UCHAR)]
-        return self._convert_data2ascii(fmt)
+        return _DST.pack(
+                b'\x80\x00\x02',
+                dst_net_addr, dst_node_num, dst_unit_addr) + self._src_suffix
+
+    def replace_service_id(self, msg, srv_id):
+        """!
+        Replace service ID in a message created by this class.
+        @param[in] msg bytes fins binary message.
+        @param[in] srv_id Service ID between 0x00 and 0xFF.
+        @return bytes fins binary message with the service ID.
+        """
+        return msg[:9] + bytes((srv_id,)) + msg[10:]
 
     def command_read_mem_area(self, mem_area, addr, bit, num):
         """!
@@ -255,13 +277,27 @@ class DataCreator():
         @param[in] num byte/word size of data to be read.
         @return bytes fins binary message.
         """
-        fmt = [
-                (b'\x01\x01', DataCreator.BYTES),
-                (mem_area[0], DataCreator.UCHAR),
-                (addr, DataCreator.USHORT),
-                (bit, DataCreator.UCHAR),
-                (num, DataCreator.USHORT)]
-        return self._header_bin + self._convert_data2ascii(fmt)
+        return self._header() + _READ_CMD.pack(
+                b'\x01\x01', mem_area[0], addr, bit, num)
+
+    def command_read_mem_area_into(self, buf, mem_area, addr, bit, num):
+        """!
+        Same as command_read_mem_area, but the message is written
+        into a buffer given by the caller.
+        @param[in] buf writable buffer such as bytearray.
+           It must be 18 bytes or longer.
+        @param[in] mem_area memory area type.
+        @param[in] addr address in the memory area.
+        @param[in] bit Bit of the address.
+        @param[in] num byte/word size of data to be read.
+        @return int length of the message written in buf.
+        """
+        header = self._header()
+        header_len = len(header)
+        buf[:header_len] = header
+        _READ_CMD.pack_into(
+                buf, header_len, b'\x01\x01', mem_area[0], addr, bit, num)
+        return header_len + _READ_CMD.size
 
     def command_write_mem_area(self, mem_area, addr, bit, num, data):
         """!
@@ -276,29 +312,191 @@ class DataCreator():
         @return bytes fins binary message.
         @retval None number and length of data are mismatch.
         """
-        fmt = [
-                (b'\x01\x02', DataCreator.BYTES),
-                (mem_area[0], DataCreator.UCHAR),
-                (addr, DataCreator.USHORT),
-                (bit, DataCreator.UCHAR),
-                (num, DataCreator.USHORT)]
+        parts = self.command_write_mem_area_parts(
+                mem_area, addr, bit, num, data)
+        if parts is None:
+            return None
+        return b''.join(parts)
+
+    def command_write_mem_area_parts(self, mem_area, addr, bit, num, data):
+        """!
+        Same as command_write_mem_area, but the message is returned
+        as segments so that it can be sent without concatenation.
+        @param[in] mem_area memory area type.
+        @param[in] addr address in the memory area.
+        @param[in] bit Bit of the address.
+        @param[in] num byte/word size of data to be written.
+        @param[in] data data to be written.
+        @return list of bytes segments of the message.
+        @retval None number and length of data are mismatch.
+        """
         if isinstance(data, list):
             if num != len(data):
                 return None
-            for a_data in data:
-                fmt.append((a_data[0], a_data[1]))
+            dtype = data[0][1] if data else None
+            if dtype in _PACKERS and all(a_data[1] == dtype for a_data in data):
+                # All of the values are the same type.
+                return self.command_write_mem_area_bulk_parts(
+                        mem_area, addr, bit, num,
+                        [a_data[0] for a_data in data], dtype)
+            payload = self._convert_data2ascii(data)
         else:
-            fmt.append((data[0], data[1]))
-        return self._header_bin + self._convert_data2ascii(fmt)
+            payload = self._convert_data2ascii([data])
+        return [self._header(),
+                _WRITE_CMD_HDR.pack(b'\x01\x02', mem_area[0], addr, bit, num),
+                payload]
+
+    def command_write_mem_area_bulk(self, mem_area, addr, bit, num, values, dtype):
+        """!
+        Create command to write values of the same type.
+        @param[in] mem_area memory area type.
+        @param[in] addr address in the memory area.
+        @param[in] bit Bit of the address.
+        @param[in] num byte/word size of data to be written.
+        @param[in] values sequence of values such as list or array.array.
+        @param[in] dtype type of the values.
+        @return bytes fins binary message.
+        @retval None number and length of values are mismatch.
+        """
+        parts = self.command_write_mem_area_bulk_parts(
+                mem_area, addr, bit, num, values, dtype)
+        if parts is None:
+            return None
+        return b''.join(parts)
 
-    def __del__(self):
-        """!Destructor
+    def command_write_mem_area_bulk_parts(self, mem_area, addr, bit, num, values, dtype):
+        """!
+        Same as command_write_mem_area_bulk, but the message is returned
+        as segments so that it can be sent without concatenation.
+        @return list of bytes segments of the message.
+        @retval None number and length of values are mismatch.
         """
-        pass
+        if num != len(values):
+            return None
+        header = self._header()
+        if dtype not in _PACKERS:
+            payload = self._convert_data2ascii(
+                    [(value, dtype) for value in values])
+        elif dtype[1] <= 2:
+            return [header, _write_packer(num, dtype[0]).pack(
+                    b'\x01\x02', mem_area[0], addr, bit, num, *values)]
+        else:
+            payload = _pack_values(values, dtype)
+        return [header,
+                _WRITE_CMD_HDR.pack(b'\x01\x02', mem_area[0], addr, bit, num),
+                payload]
+
+
+## Precompiled packers for each fixed size type.
+_PACKERS = {t: struct.Struct('!'+t[0]) for t in (
+    DataCreator.CHAR, DataCreator.SCHAR, DataCreator.UCHAR,
+    DataCreator.SHORT, DataCreator.USHORT,
+    DataCreator.INT, DataCreator.UINT,
+    DataCreator.LONG, DataCreator.ULONG,
+    DataCreator.LONGLONG, DataCreator.ULONGLONG,
+    DataCreator.FLOAT, DataCreator.DOUBLE)}
+
+## ICF, RSV, GCT and destination of the header.
+_DST = struct.Struct('!3sBBB')
+
+## Command code, memory area, address, bit and number of elements.
+_READ_CMD = struct.Struct('!2sBHBH')
+_WRITE_CMD_HDR = struct.Struct('!2sBHBH')
+
+## Return ID (end code) in a response.
+_RET_ID = struct.Struct('!H')
+
+
+@functools.lru_cache(maxsize=256)
+def _get_struct(num, code):
+    """!
+    Get a compiled struct for num elements of the type code.
+    @param[in] num number of elements.
+    @param[in] code type indicator for struct.
+    @return struct.Struct
+    """
+    return struct.Struct('!'+str(num)+code)
+
+
+@functools.lru_cache(maxsize=256)
+def _write_packer(num, code):
+    """!
+    Get a compiled struct for a write command with num elements of
+    the type code following the command prefix.
+    @param[in] num number of elements.
+    @param[in] code type indicator for struct.
+    @return struct.Struct
+    """
+    return struct.Struct('!2sBHBH'+str(num)+code)
+
+
+def _swap_words(data):
+    """!
+    Reverse order of 16bit words in data.
+    @param[in] data bytes-like object whose length is dividable by two.
+    @return bytes
+    """
+    words = array.array('H')
+    words.frombytes(data)
+    words.reverse()
+    return words.tobytes()
+
+
+def _pack_values(values, dtype):
+    """!
+    Pack values of the same type at once.
+    @param[in] values sequence of values.
+    @param[in] dtype type of the values. STR and BYTES are not supported.
+    @return bytes
+    """
+    packer = _get_struct(len(values), dtype[0])
+    if dtype[1] > 2:
+        # Swapping words of the whole buffer also reverses the order of
+        # the values, so they are packed in reverse order.
+        return _swap_words(packer.pack(*values[::-1]))
+    return packer.pack(*values)
+
+
+def _encode_bytes(value):
+    """!
+    Bytes are sent as they are.
+    """
+    return value
+
+
+def _encode_str(value):
+    """!
+    Encode a string so that it can be read correctly by PLC.
+    """
+    data_bin = value.encode('utf-8')[::-1]
+    # If the data is loger than 16bit 1element,
+    # it must be swapped to be read correctory by PLC
+    if len(data_bin) > 2:
+        # set length dividable by two
+        if len(data_bin)%2 != 0:
+            data_bin = b'\x00' + data_bin
+        data_bin = _swap_words(data_bin)
+    return data_bin
+
+
+def _swapped_packer(packer):
+    """!
+    Wrap a packer for types loger than 16bit so that the words are swapped.
+    """
+    def pack(value):
+        return _swap_words(packer.pack(value))
+    return pack
 
 
-if __name__ == "__main__":
-    import argparse
-    import sys
+## Encoders of each type indicator.
+_ENCODERS = {
+    DataCreator.BYTES[0]: _encode_bytes,
+    DataCreator.STR[0]: _encode_str}
+for _type, _packer in _PACKERS.items():
+    if _type[1] > 2:
+        _ENCODERS[_type[0]] = _swapped_packer(_packer)
+    else:
+        _ENCODERS[_type[0]] = _packer.pack
+del _type, _packer
 
     
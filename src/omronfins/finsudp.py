@@ -7,11 +7,147 @@
 """!datacreator
 @brief Data creator for Omron FINS protocol.
 """
-import struct
-import binascii
 import socket
+import select
+import sys
+import time
+import array
+import selectors
+import threading
+import contextlib
 from .datacreator import DataCreator as datadef
 
+## sendmsg and recvmsg_into are not available on some platform such as Windows.
+_HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+_HAS_RECVMSG_INTO = hasattr(socket.socket, 'recvmsg_into')
+
+## Maximum number of messages sent or received by one system call.
+_BATCH_SIZE = 64
+## Size of a receive buffer for one message.
+_RECV_SIZE = 4096
+## Connected sockets shared by FinsUDP sessions opened with shared=True.
+## (ip_addr, port) -> [socket, number of sessions, lock of exchanges]
+_SOCK_POOL = {}
+_SOCK_POOL_LOCK = threading.Lock()
+
+## Interval in seconds to check whether FinsPool is closed.
+_POOL_INTERVAL = 0.1
+## Size of socket buffers of the kernel when tuned.
+_SOCK_BUF_SIZE = 4*1024*1024
+## SO_BUSY_POLL is not exported by the socket module of some Python
+## versions. The value is fixed on Linux and the option is not
+## available on the other platforms.
+_SO_BUSY_POLL = getattr(socket, 'SO_BUSY_POLL',
+                        46 if sys.platform.startswith('linux') else None)
+## Module of sendmmsg(2) and recvmmsg(2) called by ctypes. It is imported
+## on first use by _load_mmsg, because importing ctypes takes time.
+## None if they are not available.
+_mmsg = False
+
+
+def _load_mmsg():
+    """!
+    Import the module of sendmmsg(2) and recvmmsg(2) if not yet.
+    @return the module, or None if they are not available.
+    """
+    global _mmsg
+    if _mmsg is False:
+        from . import _mmsg as mmsg
+        _mmsg = mmsg if mmsg.libc is not None else None
+    return _mmsg
+
+
+def _tune_socket(sock):
+    """!
+    Enlarge socket buffers of the kernel.
+    It is best effort and errors are ignored.
+    @param[in] sock socket.
+    """
+    for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, opt, _SOCK_BUF_SIZE)
+        except socket.error:
+            pass
+
+
+def _busy_poll(sock, busy_poll_us):
+    """!
+    Let the kernel busy poll the device queue on receiving instead of
+    waiting for an interrupt.
+    It is best effort and errors are ignored.
+    @param[in] sock socket.
+    @param[in] busy_poll_us time in microseconds to busy poll.
+    """
+    if _SO_BUSY_POLL is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, _SO_BUSY_POLL, busy_poll_us)
+    except socket.error:
+        pass
+
+
+def _connect(sock, address):
+    """!
+    Connect a socket and set timeout of sending and receiving messages.
+    @param[in] sock socket.
+    @param[in] address (ip_addr, port) of PLC.
+    @retval 0 No problem
+    @retval -1 timeout
+    @retval -2 socket error
+    """
+    try:
+        sock.settimeout(5)
+        sock.connect(address)
+    except socket.timeout:
+        return -1
+    except socket.error:
+        return -2
+    sock.settimeout(1)
+    return 0
+
+
+def _wait_socket(sock, deadline, for_write=False):
+    """!
+    Wait until the socket becomes ready.
+    @param[in] sock socket.
+    @param[in] deadline time.monotonic() to give up. None means forever.
+    @param[in] for_write wait for writing if True, otherwise reading.
+    @return True if the socket is ready.
+    """
+    timeout = None
+    if deadline is not None:
+        timeout = max(deadline - time.monotonic(), 0)
+    if for_write:
+        return bool(select.select([], [sock], [], timeout)[1])
+    return bool(select.select([sock], [], [], timeout)[0])
+
+
+def _copy_payload(buf, ret_id, payload):
+    """!
+    Copy a raw payload of a response into a buffer of the caller.
+    @param[in] buf writable contiguous buffer of any item type.
+    @param[in] ret_id return_id of the read command.
+    @param[in] payload bytes-like payload, or None on failure.
+    @return same as FinsAbstruct.read_mem_area_into.
+    """
+    if payload is None:
+        return ret_id, 0
+    nbytes = len(payload)
+    view = memoryview(buf).cast('B')
+    if nbytes > len(view):
+        return -5, nbytes
+    view[:nbytes] = payload
+    return ret_id, nbytes
+
+
+def _is_sequence_form(values):
+    """!
+    Check whether values given to write_mem_area are in the form of
+    (sequence_of_values, type_of_values).
+    """
+    return (isinstance(values, tuple) and len(values) == 2
+            and isinstance(values[0], (list, tuple, array.array)))
+
 
 class FinsAbstruct():
     """!
@@ -82,7 +218,7 @@ class FinsAbstruct():
         return self._datacreator.set_destination(
             dst_net_addr, dst_node_num, dst_unit_addr, delay)
 
-    def read_mem_area(self, mem_area, addr, bit, num, dtype):
+    def read_mem_area(self, mem_area, addr, bit, num, dtype, *, raw=False):
         """!
         Read data from memory areas.
         @param[in] mem_area memory area type defined in the 
@@ -92,21 +228,68 @@ class FinsAbstruct():
         @param[in] bit Bit of the address. If the memory area type
            is not bit type, this argument is ignored.
         @param[in] num byte/word size of data to be read.
-        @param[in] dtype data type of read data.
-        @return (return_id, data) 
+        @param[in] dtype data type of read data. Ignored if raw is True.
+        @param[in] raw If True, data is not decoded and a memoryview
+           of the payload is returned instead. The view may refer to
+           the receive buffer, so it is only valid until the next call.
+        @return (return_id, data)
             - return_id indicates errors. 0 means no probrem.
                 the others means some error and it defined in
                 FINS reference manual.
             - data a value of a tuple of values. It relay on the
                 data length wheather it becomes a value or a tuple.
         """
-        msg = self._datacreator.command_read_mem_area(
-                mem_area, addr, bit, num)
+        msg = self._command_read_mem_area(mem_area, addr, bit, num)
         ret_id, bin_msg = self._send_and_recv(msg)
         if ret_id < 0:
             return ret_id, None
+        if raw:
+            return self._datacreator.decode_read_data_raw(bin_msg)
         return self._datacreator.decode_read_data(bin_msg, dtype)
 
+    def read_mem_area_into(self, buf, mem_area, addr, bit, num):
+        """!
+        Read data from memory areas and store the raw payload into buf.
+        This implementation copies the payload of the response. FinsUDP
+        receives it directly into buf.
+        @param[in] buf writable contiguous buffer such as bytearray,
+           array.array or numpy.ndarray. The payload is stored as bytes
+           in the order it came on the wire regardless of the item type.
+        @param[in] mem_area memory area type.
+        @param[in] addr address in the memory area.
+        @param[in] bit Bit of the address.
+        @param[in] num byte/word size of data to be read.
+        @return (return_id, nbytes) nbytes is the number of bytes
+            of the payload.
+        @retval -5 buf is smaller than the payload. nbytes is the size
+            needed, and the content of buf is undefined.
+        """
+        ret_id, payload = self.read_mem_area(
+                mem_area, addr, bit, num, None, raw=True)
+        return _copy_payload(buf, ret_id, payload)
+
+    def read_mem_area_batch(self, requests):
+        """!
+        Read data from memory areas by sending the commands at once.
+        Responses are matched to the commands by the service IDs, so
+        they may arrive in any order.
+        @param[in] requests list of tuples of arguments of read_mem_area.
+           [(mem_area, addr, bit, num, dtype), ...].
+        @return list of (return_id, data) for each request.
+        """
+        msgs = [self._datacreator.command_read_mem_area(
+                    mem_area, addr, bit, num)
+                for mem_area, addr, bit, num, dtype in requests]
+        results = []
+        for request, (ret_id, bin_msg) in zip(
+                requests, self._send_and_recv_batch(msgs)):
+            if ret_id < 0:
+                results.append((ret_id, None))
+            else:
+                results.append(
+                        self._datacreator.decode_read_data(bin_msg, request[4]))
+        return results
+
     def write_mem_area(self, mem_area, addr, bit, num, values):
         """!
         @param[in] mem_area memory area type defined in the 
@@ -122,22 +305,61 @@ class FinsAbstruct():
            Example.
            [(5, finsudp.datadef.USHORT)]*4 means four values of
            unsigned short are written into the memory area.
+           Values of the same type can also be given as
+           (sequence_of_values, type_of_values).
+           Example.
+           ([5, 6, 7, 8], finsudp.datadef.USHORT)
         @return  return_id 0 means no probrem.
                 the others means some error and it defined in
                 FINS reference manual.
         """
-        msg = self._datacreator.command_write_mem_area(
-                mem_area, addr, bit, num, values)
+        msg = self._command_write_mem_area(mem_area, addr, bit, num, values)
         ret_id, bin_msg = self._send_and_recv(msg)
         return self._datacreator.decode_read_data(
                 bin_msg, datadef.CHAR)[0]
 
+    def _command_read_mem_area(self, mem_area, addr, bit, num):
+        """!
+        Create command to read values given to read_mem_area.
+        @return bytes message.
+        """
+        return self._datacreator.command_read_mem_area(
+                mem_area, addr, bit, num)
+
+    def _command_write_mem_area(self, mem_area, addr, bit, num, values):
+        """!
+        Create command to write values given to write_mem_area.
+        @return bytes message.
+        """
+        if _is_sequence_form(values):
+            return self._datacreator.command_write_mem_area_bulk(
+                    mem_area, addr, bit, num, values[0], values[1])
+        return self._datacreator.command_write_mem_area(
+                mem_area, addr, bit, num, values)
+
     def _send_and_recv(self, msg):
         """
         This function must be overriten by sub-classes.
         """
         return -10, ()
 
+    def _send_and_recv_batch(self, msgs):
+        """!
+        Send messages and receive their responses.
+        Sub-classes may override this to use fewer system calls.
+        @param[in] msgs list of binary messages.
+        @return list of results of _send_and_recv for each message.
+            Responses are copied into bytes, because _send_and_recv may
+            return a view of a buffer overwritten by the next call.
+        """
+        results = []
+        for msg in msgs:
+            ret_id, res_data = self._send_and_recv(msg)
+            if res_data is not None:
+                res_data = bytes(res_data)
+            results.append((ret_id, res_data))
+        return results
+
 
 class FinsUDP(FinsAbstruct):
     """!
@@ -145,51 +367,471 @@ class FinsUDP(FinsAbstruct):
     """
     def __init__(self, src_net_addr, src_node_num, src_unit_addr=0, srv_id=0):
         super().__init__(src_net_addr, src_node_num, src_unit_addr, srv_id)
+        # Read commands are built in this buffer to avoid allocation.
+        self._tx_buf = bytearray(64)
+        self._tx_mv = memoryview(self._tx_buf)
+        self._pool = None
+        self._pending = {}
+        self._shared = None
+        self._io_lock = contextlib.nullcontext()
+        self._srv_id = srv_id
+        self._next_sid = (srv_id + 1) % 256
 
-    def open(self, ip_addr, port):
+    def open(self, ip_addr, port, tune=False, pool=None, shared=False,
+             busy_poll_us=0):
         """!
         @param[in] ip_addr IP address of PLC
         @param[in] port port number of PLC
+        @param[in] tune enlarge socket buffers of the kernel to
+            receive bursts of responses without drop.
+            The size is limited by net.core.rmem_max and
+            net.core.wmem_max on Linux.
+        @param[in] pool FinsPool receiving responses instead of the
+            calling thread. If None, responses are received by the
+            thread which sends commands.
+        @param[in] shared reuse a connected socket of other sessions
+            opened with shared=True to the same address and port.
+            The socket is closed when all of the sessions are closed.
+            Exchanges of the sessions are serialized by a lock, and
+            set_timeout affects all of the sessions.
+            It cannot be used with pool.
+        @param[in] busy_poll_us if more than 0, the kernel busy polls
+            the network device for up to this microseconds on receiving
+            (SO_BUSY_POLL). It cuts latency of short polling cycles at
+            the cost of CPU time. Linux only. Raising it above
+            net.core.busy_read needs CAP_NET_ADMIN, otherwise it is
+            ignored.
         @retval 0 No problem
         @retval -1 timeout
-        @retval -2 socket error
+        @retval -2 socket error, or pool is closed.
         """
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if shared and pool is not None:
+            raise ValueError('A shared socket cannot be registered to FinsPool.')
+        self._recv_buf = bytearray(4096)
+        self._recv_mv = memoryview(self._recv_buf)
+        self._recv_vec = None
         self._ip_addr = ip_addr
         self._port = port
-        try:
-            self._sock.settimeout(5)
-            self._sock.connect((self._ip_addr, self._port))
-        except socket.timeout:
-            return -1
-        except socket.error:
-            return -2
+        if shared:
+            return self._open_shared(tune, busy_poll_us)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if busy_poll_us > 0:
+            _busy_poll(self._sock, busy_poll_us)
+        if tune:
+            _tune_socket(self._sock)
+        ret = _connect(self._sock, (self._ip_addr, self._port))
+        if ret < 0:
+            return ret
+        if pool is not None:
+            try:
+                pool.register(self)
+            except (ValueError, KeyError, OSError):
+                self._sock.close()
+                self._sock = None
+                return -2
+            self._pool = pool
         return 0
 
+    def _open_shared(self, tune, busy_poll_us):
+        key = (self._ip_addr, self._port)
+        with _SOCK_POOL_LOCK:
+            entry = _SOCK_POOL.get(key)
+            if entry is None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                if busy_poll_us > 0:
+                    _busy_poll(sock, busy_poll_us)
+                if tune:
+                    _tune_socket(sock)
+                ret = _connect(sock, key)
+                if ret < 0:
+                    sock.close()
+                    return ret
+                entry = [sock, 0, threading.RLock()]
+                _SOCK_POOL[key] = entry
+            entry[1] += 1
+        self._sock = entry[0]
+        self._shared = entry
+        self._io_lock = entry[2]
+        return 0
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.unregister(self)
+            self._pool = None
+        if self._shared is not None:
+            with _SOCK_POOL_LOCK:
+                self._shared[1] -= 1
+                if self._shared[1] == 0:
+                    self._shared[0].close()
+                    _SOCK_POOL.pop((self._ip_addr, self._port), None)
+            self._shared = None
+            self._io_lock = contextlib.nullcontext()
+            self._sock = None
+            return
+        super().close()
+
+    def _command_read_mem_area(self, mem_area, addr, bit, num):
+        """!
+        Create command to read values in the transmit buffer.
+        @return memoryview of the transmit buffer. It is overwritten by
+            the next command.
+        """
+        msg_len = self._datacreator.command_read_mem_area_into(
+                self._tx_buf, mem_area, addr, bit, num)
+        return self._tx_mv[:msg_len]
+
+    def _command_write_mem_area(self, mem_area, addr, bit, num, values):
+        """!
+        Create command to write values as segments, which are sent by
+        sendmsg without concatenation.
+        @return list of bytes segments of the message.
+        """
+        if _is_sequence_form(values):
+            return self._datacreator.command_write_mem_area_bulk_parts(
+                    mem_area, addr, bit, num, values[0], values[1])
+        return self._datacreator.command_write_mem_area_parts(
+                mem_area, addr, bit, num, values)
+
+    def read_mem_area_into(self, buf, mem_area, addr, bit, num):
+        """!
+        Same as FinsAbstruct.read_mem_area_into, but the payload is
+        received directly into buf by recvmsg_into without copying.
+        It is copied if the session is registered to a pool, or
+        recvmsg_into is not available.
+        """
+        if self._pool is not None or not _HAS_RECVMSG_INTO:
+            return super().read_mem_area_into(buf, mem_area, addr, bit, num)
+        view = memoryview(buf).cast('B')
+        msg = self._command_read_mem_area(mem_area, addr, bit, num)
+        # The header goes to the receive buffer, and a payload longer
+        # than buf overflows into the rest of it.
+        res_len = self._exchange(
+                msg, [self._recv_mv[:14], view, self._recv_mv[14:]])
+        if res_len < 0:
+            return res_len, 0
+        ret_id = self._datacreator.decode_read_data_raw(
+                self._recv_mv[:min(res_len, 14)])[0]
+        nbytes = res_len - 14
+        if nbytes > len(view):
+            return -5, nbytes
+        return ret_id, nbytes
+
+    def set_timeout(self, timeout):
+        """!
+        Set timeout of sending and receiving messages.
+        It is 1 second after opening.
+        @param[in] timeout timeout in seconds.
+        """
+        self._sock.settimeout(timeout)
+
     def _send_and_recv(self, msg):
         """!
-        @param[in] msg binary message to be sent
+        @param[in] msg binary message to be sent, or a list of
+            segments of the message.
+        @return (length, response) response is a memoryview of the
+            receive buffer. It is overwritten by the next call, so copy it
+            with bytes() to keep it.
         @retval 0 No problem
         @retval -1 send timeout
         @retval -2 send socket error
         @retval -3 receive timeout
         @retval -4 receive socket error
         """
-        try:
-            self._sock.settimeout(1)
+        if self._pool is not None:
+            return self._send_and_recv_pooled(msg)
+        res_len = self._exchange(msg, None)
+        if res_len < 0:
+            return res_len, None
+        return res_len, self._recv_mv[:res_len]
+
+    def _exchange(self, msg, buffers):
+        """!
+        Send a message and receive its response.
+        @param[in] msg binary message to be sent, or a list of
+            segments of the message.
+        @param[in] buffers list of buffers into which the response is
+            scattered by recvmsg_into. The first one must be the head of
+            the receive buffer. If None, the response is received into
+            the receive buffer.
+        @return length of the response, or the negative return_id of
+            _send_and_recv.
+        """
+        sid = (msg[0] if isinstance(msg, list) else msg)[9]
+        with self._io_lock:
+            try:
+                self._send(msg)
+            except socket.timeout:
+                return -1
+            except socket.error:
+                return -2
+            timeout = self._sock.gettimeout()
+            deadline = None
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
+            try:
+                while True:
+                    if buffers is None:
+                        res_len = self._sock.recv_into(self._recv_buf)
+                    else:
+                        res_len = self._sock.recvmsg_into(buffers)[0]
+                    # Drop late responses to commands which have timed out.
+                    if res_len < 10 or self._is_response(sid):
+                        return res_len
+                    # They do not extend the timeout.
+                    if deadline is not None and time.monotonic() > deadline:
+                        return -3
+            except socket.timeout:
+                return -3
+            except socket.error:
+                return -4
+
+    def _is_response(self, sid):
+        """!
+        Check whether the message in the receive buffer is the response
+        to the command sent with the service ID.
+        On a shared socket, responses to the other sessions arrive too, and
+        they may have the same service ID, so the addresses are checked
+        as well.
+        @param[in] sid service ID of the command.
+        """
+        if self._shared is not None:
+            return self._datacreator.is_response_to_me(
+                    self._recv_mv[:10], sid)
+        return self._recv_buf[9] == sid
+
+    def _send(self, msg):
+        if not isinstance(msg, list):
             self._sock.sendall(msg)
+        elif _HAS_SENDMSG:
+            self._sock.sendmsg(msg)
+        else:
+            self._sock.sendall(b''.join(msg))
+
+    def _send_and_recv_pooled(self, msg):
+        """!
+        Send a message and wait for its response received by the pool.
+        The response is identified by the service ID.
+        @param[in] msg binary message to be sent, or a list of
+            segments of the message.
+        @return same as _send_and_recv, but response is bytes.
+        """
+        sid = (msg[0] if isinstance(msg, list) else msg)[9]
+        slot = [threading.Event(), None]
+        self._pending[sid] = slot
+        try:
+            try:
+                self._send(msg)
+            except socket.timeout:
+                return -1, None
+            except socket.error:
+                return -2, None
+            if not slot[0].wait(self._sock.gettimeout()):
+                return -3, None
+        finally:
+            self._pending.pop(sid, None)
+        if isinstance(slot[1], Exception):
+            return -4, None
+        return len(slot[1]), slot[1]
+
+    def _drain(self, recv_vec):
+        """!
+        Receive responses which have arrived and pass them to the
+        waiting commands. This is called by FinsPool when the socket
+        becomes readable.
+        @param[in] recv_vec RecvVector of the pool to receive all of the
+            arrived responses by one recvmmsg(2) call, or None to receive
+            one by recv.
+        """
+        try:
+            if recv_vec is None:
+                res_list = [self._sock.recv(_RECV_SIZE)]
+            else:
+                res_list = recv_vec.recv(self._sock, _BATCH_SIZE)
         except socket.timeout:
-            return -1, None
-        except socket.error:
-            return -2, None
+            return
+        except socket.error as exc:
+            for slot in list(self._pending.values()):
+                slot[1] = exc
+                slot[0].set()
+            return
+        for res_data in res_list:
+            if len(res_data) < 10:
+                continue
+            slot = self._pending.get(res_data[9])
+            if slot is not None:
+                slot[1] = res_data
+                slot[0].set()
+
+    def _send_and_recv_batch(self, msgs):
+        """!
+        Send messages and receive their responses.
+        Each message is sent with its own service ID, and responses are
+        matched to the messages by the ID. Responses to none of them,
+        such as late ones to timed-out commands, are dropped.
+        On Linux, up to 64 messages are sent by one sendmmsg(2) call and
+        the responses are received by recvmmsg(2).
+        @param[in] msgs list of binary messages.
+        @return list of results of _send_and_recv for each message.
+        """
+        results = []
+        for begin in range(0, len(msgs), _BATCH_SIZE):
+            chunk = [self._datacreator.replace_service_id(
+                        b''.join(msg) if isinstance(msg, list) else bytes(msg),
+                        sid)
+                     for msg, sid in zip(
+                        msgs[begin:begin + _BATCH_SIZE],
+                        self._allocate_sids(len(msgs) - begin))]
+            mmsg = _load_mmsg()
+            if mmsg is None or self._pool is not None:
+                results += super()._send_and_recv_batch(chunk)
+                continue
+            if self._recv_vec is None:
+                self._recv_vec = mmsg.RecvVector(_BATCH_SIZE, _RECV_SIZE)
+            with self._io_lock:
+                results += self._send_and_recv_mmsg(chunk)
+        return results
+
+    def _allocate_sids(self, num):
+        """!
+        Allocate service IDs for a batch of messages.
+        They go round so that late responses to the previous batches are
+        not taken for responses to the next one.
+        @param[in] num number of messages. At most _BATCH_SIZE IDs are
+            allocated at once.
+        @return list of service IDs.
+        """
+        sids = []
+        while len(sids) < min(num, _BATCH_SIZE):
+            sid = self._next_sid
+            self._next_sid = (sid + 1) % 256
+            # The ID of single commands is kept for them.
+            if sid != self._srv_id:
+                sids.append(sid)
+        return sids
+
+    def _send_and_recv_mmsg(self, msgs):
+        """!
+        Send at most _BATCH_SIZE messages and receive their responses.
+        The messages must have different service IDs. The timeout of the
+        socket applies to the whole batch.
+        """
+        timeout = self._sock.gettimeout()
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
         try:
-            self._sock.settimeout(1)
-            res_data = self._sock.recv(4096)
+            _mmsg.sendmmsg(self._sock, msgs, deadline)
         except socket.timeout:
-            return -3, None
+            return [(-1, None)]*len(msgs)
         except socket.error:
-            return -4, None
-        return len(res_data), res_data
+            return [(-2, None)]*len(msgs)
+        waiting = {msg[9]: i for i, msg in enumerate(msgs)}
+        results = [(-3, None)]*len(msgs)
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        while waiting:
+            try:
+                if not _wait_socket(self._sock, deadline):
+                    break
+                res_list = self._recv_vec.recv(self._sock, len(waiting))
+            except socket.error:
+                for i in waiting.values():
+                    results[i] = (-4, None)
+                break
+            for res_data in res_list:
+                if len(res_data) < 10:
+                    continue
+                i = waiting.pop(res_data[9], None)
+                if i is not None:
+                    results[i] = (len(res_data), res_data)
+        return results
+
 
-    
+class FinsPool():
+    """!
+    Receive responses of many FinsUDP sessions by one thread.
+    Sockets are watched by selectors.DefaultSelector (epoll on Linux),
+    so polling many PLCs does not need a thread per PLC.
+    Example:
+        pool = FinsPool()
+        fins1 = FinsUDP(0, 170)
+        fins1.open('192.168.2.13', 9600, pool=pool)
+        fins2 = FinsUDP(0, 170)
+        fins2.open('192.168.2.14', 9600, pool=pool)
+    A session registered to a pool waits for a response identified by
+    its service ID, so only one command of a service ID can be sent
+    at once in a session.
+    """
+    def __init__(self):
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._closed = False
+        # Only the thread of the pool receives, so the buffers are shared
+        # by all of the sessions.
+        self._recv_vec = None
+
+    def register(self, fins):
+        """!
+        Start receiving responses of a session.
+        It is called by FinsUDP.open.
+        @param[in] fins opened FinsUDP.
+        @exception ValueError the pool is closed.
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError('FinsPool is closed.')
+            self._sel.register(fins._sock, selectors.EVENT_READ, fins)
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def unregister(self, fins):
+        """!
+        Stop receiving responses of a session.
+        It is called by FinsUDP.close.
+        @param[in] fins FinsUDP registered.
+        """
+        with self._lock:
+            try:
+                self._sel.unregister(fins._sock)
+            except (KeyError, ValueError):
+                pass
+
+    def close(self):
+        """!
+        Stop the thread receiving responses.
+        """
+        with self._lock:
+            thread = self._thread
+            self._running = False
+            self._closed = True
+            self._thread = None
+        if thread is not None:
+            thread.join()
+        self._sel.close()
+
+    def _drain(self, timeout):
+        """!
+        Receive responses which have arrived on the registered sessions.
+        It is called repeatedly by the thread of the pool.
+        @param[in] timeout seconds to wait for any response.
+        """
+        if not self._sel.get_map():
+            time.sleep(timeout)
+            return
+        mmsg = _load_mmsg()
+        if mmsg is None:
+            recv_vec = None
+        else:
+            if self._recv_vec is None:
+                self._recv_vec = mmsg.RecvVector(_BATCH_SIZE, _RECV_SIZE)
+            recv_vec = self._recv_vec
+        for key, _ in self._sel.select(timeout):
+            key.data._drain(recv_vec)
 
+    def _run(self):
+        while self._running:
+            self._drain(_POOL_INTERVAL)
@@ -0,0 +1,177 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright (c) 2022 Taishi Ueda <taishi.ueda@gmail.com>
+#
+"""!finsudp_async
+@brief Send and receive FINS commands via UDP with asyncio.
+It is apart from finsudp so that synchronous users do not import asyncio.
+"""
+import asyncio
+from .finsudp import FinsAbstruct, datadef, _tune_socket, _copy_payload
+
+
+class _FinsProtocol(asyncio.DatagramProtocol):
+    """!
+    Pass received datagrams to FinsUDPAsync.
+    """
+    def __init__(self, fins):
+        self._fins = fins
+
+    def datagram_received(self, data, addr):
+        self._fins._on_response(data)
+
+    def error_received(self, exc):
+        self._fins._on_error(exc)
+
+    def connection_lost(self, exc):
+        self._fins._on_error(exc if exc is not None else ConnectionError())
+
+
+class FinsUDPAsync(FinsAbstruct):
+    """!
+    Send and receive FINS commands via UDP with asyncio.
+    Commands can be issued concurrently on one socket. Each of them is
+    sent with its own service ID, and its response is picked up by the ID.
+    Example:
+        results = await asyncio.gather(
+            fins.read_mem_area(datadef.EM0_WORD, 0, 0, 1, datadef.USHORT),
+            fins.read_mem_area(datadef.EM0_WORD, 1, 0, 1, datadef.USHORT))
+    """
+    def __init__(self, src_net_addr, src_node_num, src_unit_addr=0, srv_id=0):
+        super().__init__(src_net_addr, src_node_num, src_unit_addr, srv_id)
+        self._transport = None
+        self._pending = {}
+        self._sid_sem = None
+        self._next_sid = srv_id
+        self._timeout = 1
+
+    async def open(self, ip_addr, port, tune=False):
+        """!
+        @param[in] ip_addr IP address of PLC
+        @param[in] port port number of PLC
+        @param[in] tune enlarge socket buffers of the kernel.
+            It is recommended when many commands are issued at once,
+            otherwise responses may be dropped by the kernel.
+        @retval 0 No problem
+        @retval -1 timeout
+        @retval -2 socket error
+        """
+        self._ip_addr = ip_addr
+        self._port = port
+        self._sid_sem = asyncio.Semaphore(256)
+        loop = asyncio.get_running_loop()
+        try:
+            self._transport, _ = await asyncio.wait_for(
+                    loop.create_datagram_endpoint(
+                        lambda: _FinsProtocol(self),
+                        remote_addr=(self._ip_addr, self._port)),
+                    5)
+        except asyncio.TimeoutError:
+            return -1
+        except OSError:
+            return -2
+        if tune:
+            _tune_socket(self._transport.get_extra_info('socket'))
+        return 0
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def set_timeout(self, timeout):
+        """!
+        Set timeout of receiving responses. It is 1 second by default.
+        @param[in] timeout timeout in seconds.
+        """
+        self._timeout = timeout
+
+    async def read_mem_area(self, mem_area, addr, bit, num, dtype, *, raw=False):
+        """!
+        Coroutine version of FinsAbstruct.read_mem_area.
+        A raw payload is a view of its own response, so it stays valid.
+        """
+        msg = self._datacreator.command_read_mem_area(
+                mem_area, addr, bit, num)
+        ret_id, bin_msg = await self._send_and_recv(msg)
+        if ret_id < 0:
+            return ret_id, None
+        if raw:
+            return self._datacreator.decode_read_data_raw(bin_msg)
+        return self._datacreator.decode_read_data(bin_msg, dtype)
+
+    async def read_mem_area_into(self, buf, mem_area, addr, bit, num):
+        """!
+        Coroutine version of FinsAbstruct.read_mem_area_into.
+        """
+        ret_id, payload = await self.read_mem_area(
+                mem_area, addr, bit, num, None, raw=True)
+        return _copy_payload(buf, ret_id, payload)
+
+    async def read_mem_area_batch(self, requests):
+        """!
+        Coroutine version of FinsAbstruct.read_mem_area_batch.
+        The commands are issued concurrently.
+        """
+        return list(await asyncio.gather(
+                *[self.read_mem_area(*request) for request in requests]))
+
+    async def write_mem_area(self, mem_area, addr, bit, num, values):
+        """!
+        Coroutine version of FinsAbstruct.write_mem_area.
+        """
+        msg = self._command_write_mem_area(mem_area, addr, bit, num, values)
+        ret_id, bin_msg = await self._send_and_recv(msg)
+        if ret_id < 0:
+            return ret_id
+        return self._datacreator.decode_read_data(
+                bin_msg, datadef.CHAR)[0]
+
+    async def _send_and_recv(self, msg):
+        """!
+        @param[in] msg binary message to be sent
+        @retval 0 No problem
+        @retval -2 send socket error
+        @retval -3 receive timeout
+        @retval -4 receive socket error
+        """
+        # Wait until a service ID becomes free if all of them are in use.
+        async with self._sid_sem:
+            sid = self._allocate_sid()
+            msg = self._datacreator.replace_service_id(msg, sid)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[sid] = future
+            try:
+                try:
+                    self._transport.sendto(msg)
+                except OSError:
+                    return -2, None
+                res_data = await asyncio.wait_for(future, self._timeout)
+            except asyncio.TimeoutError:
+                return -3, None
+            except OSError:
+                return -4, None
+            finally:
+                self._pending.pop(sid, None)
+        return len(res_data), res_data
+
+    def _allocate_sid(self):
+        while self._next_sid in self._pending:
+            self._next_sid = (self._next_sid + 1) % 256
+        sid = self._next_sid
+        self._next_sid = (sid + 1) % 256
+        return sid
+
+    def _on_response(self, data):
+        if len(data) < 10:
+            return
+        future = self._pending.get(data[9])
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def _on_error(self, exc):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
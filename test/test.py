@@ -9,9 +9,15 @@ import unittest
 import time
 import os
 import sys
+import array
+import socket
+import struct
+import threading
+import asyncio
 sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
 from omronfins.datacreator import DataCreator
-from omronfins.finsudp import FinsUDP
+from omronfins.finsudp import FinsUDP, FinsPool
+from omronfins.finsudp_async import FinsUDPAsync
 import omronfins.finsudp as finsudp
 
 
@@ -27,6 +33,14 @@ class TestCase0(unittest.TestCase):
     - [x] test06: convert single data
     - [x] test07: convert multiple data as a tuple
     - [x] test08: convert string value
+    - [x] test09: create command to write multiple values of the same type
+    - [x] test10: decode string written by write command
+    - [x] test11: check whether a message is a response to me
+    - [x] test12: create command to read mem area into a buffer
+    - [x] test13: create command to write a sequence of values
+    - [x] test14: replace service ID in a command
+    - [x] test15: split response into end code and raw payload
+    - [x] test16: read and write with sub-classes of FinsAbstruct
     """
     def setUp(self):
         self.data_creator = DataCreator(
@@ -104,10 +118,130 @@ class TestCase0(unittest.TestCase):
         ret_id, out = self.data_creator.decode_read_data(test_data, DataCreator.STR)
         self.assertEqual(out, 'brabrabra')
 
+    def test09(self):
+        self.data_creator.set_destination(
+                dst_net_addr=0x0,
+                dst_node_num=0x2,
+                dst_unit_addr=0x12)
+        header = b'\x80\x00\x02\x00\x02\x12\x00\xaa\x00\x00\x01\x02\xa0\x00\x00\x00\x00\x02'
+        data = self.data_creator.command_write_mem_area(
+                finsudp.datadef.EM0_WORD, 0, 0, 2, [(5, DataCreator.USHORT), (6, DataCreator.USHORT)])
+        self.assertEqual(data, header + b'\x00\x05\x00\x06')
+        data = self.data_creator.command_write_mem_area(
+                finsudp.datadef.EM0_WORD, 0, 0, 2,
+                [(0x12345678, DataCreator.UINT), (0x9abcdef0, DataCreator.UINT)])
+        self.assertEqual(data, header + b'\x56\x78\x12\x34\xde\xf0\x9a\xbc')
+
+    def test10(self):
+        test_header = b'\x80\x00\x02\x00\r\x00\x00\xaa\x00\x00\x01\x01\x00\x00'
+        for str_data in ('testhogehoge', 'ok', 'caf\u00e9'):
+            comm = self.data_creator.command_write_mem_area(
+                    finsudp.datadef.EM0_WORD, 0, 0, 3, (str_data, DataCreator.STR))
+            ret_id, out = self.data_creator.decode_read_data(
+                    test_header + comm[18:], DataCreator.STR)
+            self.assertEqual(out, str_data)
+
+    def test11(self):
+        self.data_creator.set_destination(
+                dst_net_addr=0,
+                dst_node_num=13,
+                dst_unit_addr=0)
+        test_response = b'\xc0\x00\x02\x00\xaa\x00\x00\r\x00\x00\x01\x01\x00\x00'
+        self.assertTrue(self.data_creator.is_response_to_me(test_response))
+        test_response = b'\xc0\x00\x02\x00\xaa\x00\x00\x0e\x00\x00\x01\x01\x00\x00'
+        self.assertFalse(self.data_creator.is_response_to_me(test_response))
+        test_response = b'\xc0\x00\x02\x00\xaa\x00\x00\r\x00\x01\x01\x01\x00\x00'
+        self.assertFalse(self.data_creator.is_response_to_me(test_response))
+        self.assertTrue(self.data_creator.is_response_to_me(test_response, 1))
+        self.assertFalse(self.data_creator.is_response_to_me(b'\xc0\x00'))
+
+    def test12(self):
+        self.data_creator.set_destination(
+                dst_net_addr=0,
+                dst_node_num=13,
+                dst_unit_addr=0)
+        buf = bytearray(64)
+        msg_len = self.data_creator.command_read_mem_area_into(
+                buf, finsudp.datadef.EM0_WORD, 500, 0, 1)
+        self.assertEqual(
+                buf[:msg_len], b'\x80\x00\x02\x00\r\x00\x00\xaa\x00\x00\x01\x01\xa0\x01\xf4\x00\x00\x01')
+        self.assertEqual(len(buf), 64)
+
+    def test13(self):
+        self.data_creator.set_destination(
+                dst_net_addr=0x0,
+                dst_node_num=0x2,
+                dst_unit_addr=0x12)
+        data = self.data_creator.command_write_mem_area_bulk(
+                finsudp.datadef.EM0_WORD, 0, 0, 3, [5, 6, 7], DataCreator.USHORT)
+        self.assertEqual(data, self.data_creator.command_write_mem_area(
+                finsudp.datadef.EM0_WORD, 0, 0, 3,
+                [(5, DataCreator.USHORT), (6, DataCreator.USHORT), (7, DataCreator.USHORT)]))
+        data = self.data_creator.command_write_mem_area_bulk(
+                finsudp.datadef.EM0_WORD, 0, 0, 2, (0x12345678, 0x9abcdef0), DataCreator.UINT)
+        self.assertEqual(data[18:], b'\x56\x78\x12\x34\xde\xf0\x9a\xbc')
+        data = self.data_creator.command_write_mem_area_bulk(
+                finsudp.datadef.EM0_WORD, 0, 0, 2, [5], DataCreator.USHORT)
+        self.assertIsNone(data)
+
+    def test14(self):
+        self.data_creator.set_destination(
+                dst_net_addr=0,
+                dst_node_num=13,
+                dst_unit_addr=0)
+        comm = self.data_creator.command_read_mem_area(
+                finsudp.datadef.EM0_WORD, 500, 0, 1)
+        comm = self.data_creator.replace_service_id(comm, 0x7f)
+        self.assertEqual(
+                comm, b'\x80\x00\x02\x00\r\x00\x00\xaa\x00\x7f\x01\x01\xa0\x01\xf4\x00\x00\x01')
+
+    def test15(self):
+        ret_id, payload = self.data_creator.decode_read_data_raw(
+                b'\xc0\x00\x02\x00\xaa\x00\x00\r\x00\x00\x01\x01\x00\x00\x00\x01\x00\x02')
+        self.assertEqual(ret_id, 0)
+        self.assertIsInstance(payload, memoryview)
+        self.assertEqual(payload.tobytes(), b'\x00\x01\x00\x02')
+
+    def test16(self):
+        self.assertEqual(
+                finsudp.FinsAbstruct(0, 170).read_mem_area(
+                    DataCreator.EM0_WORD, 5, 0, 2, DataCreator.USHORT),
+                (-10, None))
+        fins = LocalFins()
+        self.assertEqual(
+                fins.read_mem_area(
+                    DataCreator.EM0_WORD, 5, 0, 2, DataCreator.USHORT),
+                (0, (5, 6)))
+        self.assertEqual(
+                fins.write_mem_area(
+                    DataCreator.EM0_WORD, 5, 0, 2, [(1, DataCreator.USHORT)]*2),
+                0)
+        self.assertEqual(
+                fins.write_mem_area(
+                    DataCreator.EM0_WORD, 5, 0, 2, ([1, 2], DataCreator.USHORT)),
+                0)
+        for msg in fins.sent:
+            self.assertIsInstance(msg, bytes)
+
     def tearDown(self):
         pass
 
 
+class LocalFins(finsudp.FinsAbstruct):
+    """!
+    FinsAbstruct responded by FakePLC without sockets.
+    It overrides only the hook of sending and receiving.
+    """
+    def __init__(self):
+        super().__init__(0, 170)
+        self.sent = []
+
+    def _send_and_recv(self, msg):
+        self.sent.append(msg)
+        res_data = FakePLC._respond(msg)
+        return len(res_data), res_data
+
+
 class TestCase1(unittest.TestCase):
     """!
     # Tester for FinsUDP.
@@ -192,5 +326,351 @@ class TestCase1(unittest.TestCase):
         self.fins.close()
 
 
+class FakePLC():
+    """!
+    Respond to FINS commands on loopback like a PLC.
+    A word at address a holds a value a.
+    """
+    def __init__(self, drop=(), hold=1, reverse=True, noise=False):
+        """!
+        @param[in] drop indices of received commands not to be responded.
+        @param[in] hold number of commands whose responses are held and
+            sent at once.
+        @param[in] reverse send the held responses in reverse order.
+        @param[in] noise keep sending the last response with another
+            service ID while no command arrives.
+        """
+        self.drop = set(drop)
+        self.hold = hold
+        self.reverse = reverse
+        self.noise = noise
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.settimeout(0.05)
+        self.port = self._sock.getsockname()[1]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._sock.close()
+
+    def _run(self):
+        num_recv = 0
+        held = []
+        last = None
+        while not self._stop.is_set():
+            try:
+                data, addr = self._sock.recvfrom(4096)
+            except socket.timeout:
+                if self.noise and last is not None:
+                    self._sock.sendto(
+                            last[:9] + bytes(((last[9] + 128) % 256,))
+                            + last[10:], addr)
+                continue
+            last = self._respond(data)
+            if num_recv not in self.drop:
+                held.append(self._respond(data))
+            num_recv += 1
+            if num_recv % self.hold == 0:
+                for res in (reversed(held) if self.reverse else held):
+                    self._sock.sendto(res, addr)
+                held = []
+
+    @staticmethod
+    def _respond(data):
+        header = bytes((0xc0, 0, 2)) + data[6:9] + data[3:6] + data[9:10]
+        payload = b''
+        if data[10:12] == b'\x01\x01':
+            addr, num = struct.unpack('!H', data[13:15])[0], struct.unpack('!H', data[16:18])[0]
+            payload = struct.pack('!%dH' % num, *range(addr, addr + num))
+        return header + data[10:12] + b'\x00\x00' + payload
+
+
+class TestCase2(unittest.TestCase):
+    """!
+    # Tester for FinsUDP with a fake PLC on loopback.
+    - [x] test01: batch read with a response dropped.
+    - [x] test02: batch read with responses reordered.
+    - [x] test03: batch read after late responses.
+    - [x] test04: batch read without sendmmsg.
+    - [x] test05: batch read without sendmmsg with a response dropped.
+    - [x] test06: batch read without sendmmsg after late responses.
+    - [x] test07: read into a buffer of words.
+    - [x] test08: read into a buffer smaller than the payload.
+    - [x] test09: exchanges of sessions registered to a pool.
+    - [x] test10: open with a closed pool.
+    - [x] test11: close sessions sharing a socket.
+    - [x] test12: late response to another session sharing a socket.
+    - [x] test13: timeout of batch read while other messages arrive.
+    - [x] test14: timeout of read while other messages arrive.
+    """
+    def setUp(self):
+        self.plc = None
+        self.fins = FinsUDP(0, 170)
+        self.mmsg = finsudp._mmsg
+        self.has_recvmsg_into = finsudp._HAS_RECVMSG_INTO
+
+    def _open(self, **kwargs):
+        self.plc = FakePLC(**kwargs)
+        self.assertEqual(self.fins.open('127.0.0.1', self.plc.port), 0)
+        self.fins.set_destination(0, 13, 0)
+        self.fins.set_timeout(0.2)
+
+    def _read_batch(self, addrs):
+        return self.fins.read_mem_area_batch(
+                [(DataCreator.EM0_WORD, addr, 0, 1, DataCreator.USHORT)
+                 for addr in addrs])
+
+    def test01(self):
+        self._open(drop=(1,))
+        self.assertEqual(
+                self._read_batch([0, 10, 20, 30]),
+                [(0, 0), (-3, None), (0, 20), (0, 30)])
+
+    def test02(self):
+        self._open(hold=4)
+        self.assertEqual(
+                self._read_batch([0, 10, 20, 30]),
+                [(0, 0), (0, 10), (0, 20), (0, 30)])
+
+    def test03(self):
+        self._open(hold=2)
+        self.assertEqual(self._read_batch([0]), [(-3, None)])
+        # The response to the first batch arrives with the second one.
+        self.assertEqual(
+                self._read_batch([10, 20, 30]),
+                [(0, 10), (0, 20), (0, 30)])
+
+    def test04(self):
+        finsudp._mmsg = None
+        self._open()
+        self.assertEqual(
+                self._read_batch([0, 10, 20, 30]),
+                [(0, 0), (0, 10), (0, 20), (0, 30)])
+
+    def test05(self):
+        finsudp._mmsg = None
+        self._open(drop=(1,))
+        self.assertEqual(
+                self._read_batch([0, 10, 20, 30]),
+                [(0, 0), (-3, None), (0, 20), (0, 30)])
+
+    def test06(self):
+        finsudp._mmsg = None
+        self._open(hold=2)
+        self.assertEqual(self._read_batch([0]), [(-3, None)])
+        # The late response to address 0 arrives while waiting for 20.
+        self.assertEqual(
+                self._read_batch([10, 20, 30]),
+                [(0, 10), (-3, None), (0, 30)])
+
+    def test07(self):
+        self._open()
+        # The payload is received directly, and copied without recvmsg_into.
+        for has_recvmsg_into in (finsudp._HAS_RECVMSG_INTO, False):
+            finsudp._HAS_RECVMSG_INTO = has_recvmsg_into
+            buf = array.array('H', [0]*4)
+            ret = self.fins.read_mem_area_into(
+                    buf, DataCreator.EM0_WORD, 5, 0, 3)
+            self.assertEqual(ret, (0, 6))
+            self.assertEqual(buf.tobytes()[:6], struct.pack('!3H', 5, 6, 7))
+            if has_recvmsg_into:
+                # Nothing but the header went to the receive buffer.
+                self.assertEqual(bytes(self.fins._recv_buf[14:20]), bytes(6))
+
+    def test08(self):
+        self._open()
+        for has_recvmsg_into in (finsudp._HAS_RECVMSG_INTO, False):
+            finsudp._HAS_RECVMSG_INTO = has_recvmsg_into
+            buf = bytearray(4)
+            ret = self.fins.read_mem_area_into(
+                    buf, DataCreator.EM0_WORD, 5, 0, 3)
+            self.assertEqual(ret, (-5, 6))
+        # The next read is not affected by the overflow.
+        self.assertEqual(
+                self.fins.read_mem_area(
+                    DataCreator.EM0_WORD, 9, 0, 1, DataCreator.USHORT),
+                (0, 9))
+
+    def test09(self):
+        self.plc = FakePLC()
+        # Responses are drained by recvmmsg and by recv without it.
+        for mmsg in (self.mmsg, None):
+            finsudp._mmsg = mmsg
+            pool = FinsPool()
+            sessions = [FinsUDP(0, 170) for _ in range(2)]
+            for fins in sessions:
+                self.assertEqual(
+                        fins.open('127.0.0.1', self.plc.port, pool=pool), 0)
+                fins.set_destination(0, 13, 0)
+            for i, fins in enumerate(sessions):
+                self.assertEqual(
+                        fins.read_mem_area(
+                            DataCreator.EM0_WORD, i, 0, 2, DataCreator.USHORT),
+                        (0, (i, i + 1)))
+                self.assertEqual(
+                        fins.write_mem_area(
+                            DataCreator.EM0_WORD, 0, 0, 1,
+                            [(1, DataCreator.USHORT)]),
+                        0)
+            # The receive buffers are owned by the pool.
+            for fins in sessions:
+                self.assertIsNone(fins._recv_vec)
+                fins.close()
+            self.assertEqual(pool._recv_vec is None, finsudp._mmsg is None)
+            pool.close()
+            self.assertEqual(pool._sel.get_map(), None)
+
+    def test10(self):
+        self.plc = FakePLC()
+        pool = FinsPool()
+        pool.close()
+        self.assertEqual(self.fins.open('127.0.0.1', self.plc.port, pool=pool), -2)
+        self.assertIsNone(self.fins._sock)
+
+    def test11(self):
+        self.plc = FakePLC()
+        key = ('127.0.0.1', self.plc.port)
+        sessions = [FinsUDP(0, 170) for _ in range(2)]
+        for fins in sessions:
+            self.assertEqual(
+                    fins.open('127.0.0.1', self.plc.port, shared=True), 0)
+            fins.set_destination(0, 13, 0)
+        sock = sessions[0]._sock
+        self.assertIs(sessions[1]._sock, sock)
+        self.assertEqual(finsudp._SOCK_POOL[key][1], 2)
+        sessions[0].close()
+        self.assertEqual(finsudp._SOCK_POOL[key][1], 1)
+        self.assertEqual(
+                sessions[1].read_mem_area(
+                    DataCreator.EM0_WORD, 3, 0, 1, DataCreator.USHORT),
+                (0, 3))
+        sessions[1].close()
+        self.assertNotIn(key, finsudp._SOCK_POOL)
+        self.assertEqual(sock.fileno(), -1)
+
+    def test12(self):
+        self.plc = FakePLC(hold=2, reverse=False)
+        sessions = [FinsUDP(0, 170) for _ in range(2)]
+        for fins, node in zip(sessions, (13, 14)):
+            self.assertEqual(
+                    fins.open('127.0.0.1', self.plc.port, shared=True), 0)
+            fins.set_destination(0, node, 0)
+            fins.set_timeout(0.2)
+        self.assertEqual(
+                sessions[0].read_mem_area(
+                    DataCreator.EM0_WORD, 111, 0, 1, DataCreator.USHORT),
+                (-3, None))
+        # The late response to the first session arrives first.
+        self.assertEqual(
+                sessions[1].read_mem_area(
+                    DataCreator.EM0_WORD, 222, 0, 1, DataCreator.USHORT),
+                (0, 222))
+        for fins in sessions:
+            fins.close()
+
+    def test13(self):
+        self._open(drop=(1,), noise=True)
+        start = time.monotonic()
+        self.assertEqual(
+                self._read_batch([0, 10, 20, 30]),
+                [(0, 0), (-3, None), (0, 20), (0, 30)])
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test14(self):
+        self._open(drop=(1,), noise=True)
+        self.assertEqual(
+                self.fins.read_mem_area(
+                    DataCreator.EM0_WORD, 5, 0, 1, DataCreator.USHORT),
+                (0, 5))
+        start = time.monotonic()
+        self.assertEqual(
+                self.fins.read_mem_area(
+                    DataCreator.EM0_WORD, 6, 0, 1, DataCreator.USHORT),
+                (-3, None))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def tearDown(self):
+        finsudp._mmsg = self.mmsg
+        finsudp._HAS_RECVMSG_INTO = self.has_recvmsg_into
+        self.fins.close()
+        if self.plc is not None:
+            self.plc.close()
+
+
+class TestCase3(unittest.TestCase):
+    """!
+    # Tester for FinsUDPAsync with a fake PLC on loopback.
+    - [x] test01: concurrent reads with responses reordered.
+    - [x] test02: batch read with a response dropped.
+    - [x] test03: write with a response dropped.
+    - [x] test04: read raw payload and read into a buffer.
+    """
+    def setUp(self):
+        self.plc = None
+        self.fins = FinsUDPAsync(0, 170)
+
+    def _run(self, func, **kwargs):
+        """!
+        Run func with an opened session in a new event loop.
+        """
+        self.plc = FakePLC(**kwargs)
+        async def run():
+            self.assertEqual(
+                    await self.fins.open('127.0.0.1', self.plc.port), 0)
+            self.fins.set_destination(0, 13, 0)
+            self.fins.set_timeout(0.2)
+            try:
+                return await func()
+            finally:
+                self.fins.close()
+        return asyncio.run(run())
+
+    def test01(self):
+        async def func():
+            return await asyncio.gather(
+                    *[self.fins.read_mem_area(
+                        DataCreator.EM0_WORD, addr, 0, 2, DataCreator.USHORT)
+                      for addr in (0, 10, 20, 30)])
+        self.assertEqual(
+                self._run(func, hold=4),
+                [(0, (0, 1)), (0, (10, 11)), (0, (20, 21)), (0, (30, 31))])
+
+    def test02(self):
+        async def func():
+            return await self.fins.read_mem_area_batch(
+                    [(DataCreator.EM0_WORD, addr, 0, 1, DataCreator.USHORT)
+                     for addr in (0, 10, 20, 30)])
+        self.assertEqual(
+                self._run(func, drop=(1,)),
+                [(0, 0), (-3, None), (0, 20), (0, 30)])
+
+    def test03(self):
+        async def func():
+            return await self.fins.write_mem_area(
+                    DataCreator.EM0_WORD, 0, 0, 1, [(1, DataCreator.USHORT)])
+        self.assertEqual(self._run(func, drop=(0,)), -3)
+
+    def test04(self):
+        buf = array.array('H', [0]*2)
+        async def func():
+            ret_raw = await self.fins.read_mem_area(
+                    DataCreator.EM0_WORD, 5, 0, 2, None, raw=True)
+            ret_into = await self.fins.read_mem_area_into(
+                    buf, DataCreator.EM0_WORD, 7, 0, 2)
+            return ret_raw[0], bytes(ret_raw[1]), ret_into
+        self.assertEqual(
+                self._run(func),
+                (0, struct.pack('!2H', 5, 6), (0, 4)))
+        self.assertEqual(buf.tobytes(), struct.pack('!2H', 7, 8))
+
+    def tearDown(self):
+        if self.plc is not None:
+            self.plc.close()
+
+
 if __name__ == '__main__':
     unittest.main()